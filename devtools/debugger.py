@@ -1,115 +1,325 @@
+import os
 import sys
 import time
 import inspect
 import asyncio
-import functools
+import reprlib
+import threading
+from contextvars import ContextVar
 
-from .utils import console
+from .utils import console, _light_wraps
 from rich.tree import Tree
+from rich.text import Text
+from rich.style import Style
 from rich.traceback import install
 from rich.table import Table
 
 install()
 
-CALL_STACK = [] 
-DEBUG_TREE = None  
+# Per thread / task state of `dbg`, so concurrent decorated calls never share a tree.
+_call_stack: ContextVar[list | None] = ContextVar("_call_stack", default=None)
+_debug_tree: ContextVar["_CallRecord | None"] = ContextVar("_debug_tree", default=None)
+
+# Built once so rendering a local variable never goes through the markup parser.
+MAGENTA = Style(color="magenta")
+YELLOW = Style(color="yellow")
+
+# Caps the work and output for large locals, container reprs are cut after a few items.
+_value_repr = reprlib.Repr()
+_value_repr.maxlist = _value_repr.maxtuple = _value_repr.maxset = _value_repr.maxdict = 6
+_value_repr.maxstring = _value_repr.maxother = 80
+
+# sys.monitoring (PEP 669) delivers events per code object, so on 3.12+ `dbg`
+# only pays for the functions it decorates instead of every frame in the program.
+_USE_SYS_MONITORING = sys.version_info >= (3, 12)
+_MONITORING_TOOL_ID = None
+_MONITORED_CODE = {}
+# Guards `_MONITORED_CODE` and the tool id claim / release against concurrent `dbg` calls.
+_MONITORING_LOCK = threading.Lock()
+_UNSET = object()
 
 __all__: tuple[str, ...] = ("dbg", "step_debugger")
 
 
+def _debugging_enabled():
+    """Whether debug output would be shown at all, `DEVTOOLS_DBG=0` and a quiet console turn tracing off."""
+    return os.getenv("DEVTOOLS_DBG", "1") != "0" and not console.quiet
+
+
+def _monitoring_tool_id():
+    """Claim a `sys.monitoring` tool id for `dbg` and register its callbacks, or return None if none is free.
+
+    Must be called with `_MONITORING_LOCK` held.
+    """
+    global _MONITORING_TOOL_ID
+
+    if _MONITORING_TOOL_ID is None:
+        monitoring = sys.monitoring
+        # Ids 3 and 4 are the ones PEP 669 leaves unassigned, DEBUGGER_ID and the others belong to real tools.
+        for tool_id in (3, 4):
+            try:
+                monitoring.use_tool_id(tool_id, "devtools.dbg")
+            except ValueError:
+                continue
+            monitoring.register_callback(tool_id, monitoring.events.PY_START, _on_py_start)
+            monitoring.register_callback(tool_id, monitoring.events.LINE, _on_line)
+            monitoring.register_callback(tool_id, monitoring.events.PY_RETURN, _on_py_return)
+            _MONITORING_TOOL_ID = tool_id
+            break
+    return _MONITORING_TOOL_ID
+
+
+def _start_monitoring(code, handlers):
+    """Send the events of `code` to `handlers` until the matching `_stop_monitoring`, returns False if no tool id is free."""
+    with _MONITORING_LOCK:
+        tool_id = _monitoring_tool_id()
+        if tool_id is None:
+            return False
+
+        # Closures created by the same `def` share a code object, so every active call pushes its
+        # handlers here and events stay enabled until the last one exits.
+        handler_stack = _MONITORED_CODE.get(code)
+        if handler_stack is None:
+            handler_stack = _MONITORED_CODE[code] = []
+            events = sys.monitoring.events
+            sys.monitoring.set_local_events(tool_id, code, events.PY_START | events.LINE | events.PY_RETURN)
+        handler_stack.append(handlers)
+        return True
+
+
+def _stop_monitoring(code):
+    """Undo one `_start_monitoring` call for `code`."""
+    with _MONITORING_LOCK:
+        handler_stack = _MONITORED_CODE[code]
+        handler_stack.pop()
+        if not handler_stack:
+            sys.monitoring.set_local_events(_MONITORING_TOOL_ID, code, sys.monitoring.events.NO_EVENTS)
+            del _MONITORED_CODE[code]
+            if not _MONITORED_CODE:
+                _release_monitoring_tool_id()
+
+
+def _release_monitoring_tool_id():
+    """Give the tool id back once no `dbg` call is active, so other tools can claim it.
+
+    Must be called with `_MONITORING_LOCK` held.
+    """
+    global _MONITORING_TOOL_ID
+
+    monitoring = sys.monitoring
+    for event in (monitoring.events.PY_START, monitoring.events.LINE, monitoring.events.PY_RETURN):
+        monitoring.register_callback(_MONITORING_TOOL_ID, event, None)
+    monitoring.free_tool_id(_MONITORING_TOOL_ID)
+    _MONITORING_TOOL_ID = None
+
+
+def _active_handlers(code):
+    """Handlers of the innermost active call of `code`, or None. Read without the lock, callbacks must stay cheap."""
+    handler_stack = _MONITORED_CODE.get(code)
+    try:
+        return handler_stack[-1]
+    except (TypeError, IndexError):
+        # No entry, or another thread emptied it between the lookup and the read.
+        return None
+
+
+def _on_py_start(code, instruction_offset):
+    handlers = _active_handlers(code)
+    if handlers is None:
+        return sys.monitoring.DISABLE
+    handlers[0]()
+
+
+def _on_line(code, line_number):
+    handlers = _active_handlers(code)
+    if handlers is None:
+        return sys.monitoring.DISABLE
+    handlers[1](sys._getframe(1))
+
+
+def _on_py_return(code, instruction_offset, retval):
+    handlers = _active_handlers(code)
+    if handlers is None:
+        return sys.monitoring.DISABLE
+    handlers[2](retval)
+
+
+class _CallRecord:
+    """Events of one `dbg` call, turned into a `Tree` only once the top-level call finishes."""
+    __slots__ = ("signature", "events", "prev_locals")
+
+    def __init__(self, signature):
+        self.signature = signature
+        self.events = []
+        self.prev_locals = {}
+
+
+def _render_call(record):
+    """Build the `Tree` for a recorded call and all the calls nested inside it."""
+    node = Tree(f"[bold cyan]▶ Function Called: {record.signature}[/bold cyan]", guide_style="cyan")
+    for event in record.events:
+        kind = event[0]
+        if kind == "line":
+            _, lineno, co_name, local_vars = event
+            vars_tree = node.add(f"[blue]Line {lineno} in `{co_name}`[/blue]", guide_style="blue")
+            for var, val in local_vars.items():
+                vars_tree.add(Text.assemble((var, MAGENTA), ": ", (val, YELLOW)))
+        elif kind == "call":
+            node.add(_render_call(event[1]))
+        else:
+            node.add(f"[bold green]✔ Return:[/bold green] {event[1]}")
+    return node
+
+
 def dbg(func):
     """Decorator to visualize function execution in a nested tree format with proper function signature and return values."""
+    if not _debugging_enabled():
+        return func
 
-    def trace_calls(frame, event, arg):
-        """Trace function calls, ensuring proper nesting inside a single tree."""
-        global CALL_STACK, DEBUG_TREE
+    target_code = func.__code__
+    full_signature = f"{func.__name__}{inspect.signature(func)}"
+
+    def on_call():
+        """Open a new record for the call, nested inside the caller's record if there is one."""
+        stack = _call_stack.get()
+        if stack is None:
+            # The code runs outside of a `dbg` wrapper in this context (e.g. in another thread).
+            return
+
+        record = _CallRecord(full_signature)
+
+        if stack: 
+            stack[-1].events.append(("call", record))
+        else:
+            _debug_tree.set(record)
+        
+        stack.append(record)  
 
-        if frame.f_code.co_name == func.__name__: 
-            if event == "call":
-                func_name = func.__name__
-                func_args = inspect.signature(func)
-                full_signature = f"{func_name}{func_args}"
+    def on_line(frame):
+        """Record the line about to execute and the variables rebound since the previous line."""
+        stack = _call_stack.get()
+        if stack:
+            record = stack[-1]
+            local_vars = frame.f_locals
 
-                node = Tree(f"[bold cyan]▶ Function Called: {full_signature}[/bold cyan]", guide_style="cyan")
+            if local_vars:
+                prev_locals = record.prev_locals
+                changed = {var: _value_repr.repr(val) for var, val in local_vars.items()
+                           if prev_locals.get(var, _UNSET) is not val}
+                record.prev_locals = dict(local_vars)
 
-                if CALL_STACK: 
-                    CALL_STACK[-1].add(node)
+                events = record.events
+                lineno = frame.f_lineno
+                # Consecutive events for the same line (e.g. a one-line loop) collapse into one node.
+                if events and events[-1][0] == "line" and events[-1][1] == lineno:
+                    events[-1][3].update(changed)
                 else:
-                    DEBUG_TREE = node 
-                
-                CALL_STACK.append(node)  
-            
-            elif event == "return":
-                CALL_STACK[-1].add(f"[bold green]✔ Return:[/bold green] {arg}")
-                CALL_STACK.pop()  
-            
-            return trace_lines  
+                    events.append(("line", lineno, frame.f_code.co_name, changed))
+
+    def on_return(retval):
+        """Record the return value and close the active call record."""
+        stack = _call_stack.get()
+        if stack:
+            stack[-1].events.append(("return", f"{retval}"))
+            stack.pop()  
+
+    def trace_calls(frame, event, arg):
+        """Trace function calls, ensuring proper nesting inside a single tree."""
+        if frame.f_code is target_code and event == "call": 
+            on_call()
+            return make_trace_lines()  
         return None  
 
-    def trace_lines(frame, event, arg):
-        """Log each line execution and variable values inside the active function."""
-        if event == "line" and CALL_STACK:
-            local_vars = frame.f_locals.copy() 
+    def make_trace_lines():
+        """Build the local tracer of one call, it keeps whether the frame is unwinding."""
+        unwinding = False
+
+        def trace_lines(frame, event, arg):
+            """Dispatch line and return events of the active function."""
+            nonlocal unwinding
+            if event == "line":
+                unwinding = False
+                on_line(frame)
+            elif event == "exception":
+                unwinding = True
+            elif event == "return" and not unwinding:
+                # A return right after an exception is the frame unwinding, sys.monitoring reports no
+                # PY_RETURN for it either. The wrapper drops the call from the stack.
+                on_return(arg)
+            return trace_lines
 
-            if local_vars:
-                vars_tree = Tree(f"[blue]Line {frame.f_lineno} in `{frame.f_code.co_name}`[/blue]", guide_style="blue")
-                for var, val in local_vars.items():
-                    vars_tree.add(f"[magenta]{var}[/magenta]: [yellow]{repr(val)}[/yellow]")
-                CALL_STACK[-1].add(vars_tree) 
-        
         return trace_lines
 
-    @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        global CALL_STACK, DEBUG_TREE
-        is_top_level = not CALL_STACK 
+        stack = _call_stack.get()
+        is_top_level = not stack 
+        if is_top_level:
+            stack = []
+            stack_token = _call_stack.set(stack)
+            tree_token = _debug_tree.set(None)
+        depth = len(stack)
+        previous_trace = sys.gettrace()
 
-        start_time = time.time()
-        sys.settrace(trace_calls) 
+        start_time = time.perf_counter_ns()
+        monitored = _USE_SYS_MONITORING and _start_monitoring(target_code, (on_call, on_line, on_return))
+        if not monitored:
+            sys.settrace(trace_calls) 
         try:
-            result = func(*args, **kwargs)
+            return func(*args, **kwargs)
         finally:
-            sys.settrace(None) 
-            execution_time = (time.time() - start_time) * 1000
+            if monitored:
+                _stop_monitoring(target_code)
+            else:
+                sys.settrace(previous_trace) 
+            execution_time = (time.perf_counter_ns() - start_time) / 1_000_000
+            # Calls that raised never reported a return, so drop their nodes from the stack.
+            del stack[depth:]
             
-            if is_top_level and DEBUG_TREE:  
-                DEBUG_TREE.add(f"[bold green]✔ Return:[/bold green] {result}")  
-                console.print(DEBUG_TREE)
-                console.print(f"\n[bold yellow]⏱ Execution Time:[/bold yellow] {execution_time:.2f} ms", style="yellow")
-                DEBUG_TREE = None  
-        return result
+            if is_top_level:
+                debug_tree = _debug_tree.get()
+                _call_stack.reset(stack_token)
+                _debug_tree.reset(tree_token)
+                if debug_tree:
+                    console.print(_render_call(debug_tree))
+                    console.print(f"\n[bold yellow]⏱ Execution Time:[/bold yellow] {execution_time:.2f} ms", style="yellow")
 
-    return wrapper
+    return _light_wraps(func, wrapper)
 
 
 
 def step_debugger(breakpoint_line: int = None):
     """Decorator to enable step-by-step debugging for sync & async functions."""
     def decorator(func):
+        if not _debugging_enabled():
+            return func
+
+        # Read the source once here so the tracer only indexes into it per line.
+        source_lines, start_line = inspect.getsourcelines(func)
+        source_by_lineno = {lineno: line.strip() for lineno, line in enumerate(source_lines, start=start_line)}
+
         if asyncio.iscoroutinefunction(func):
-            @functools.wraps(func)
             async def async_wrapper(*args, **kwargs):
-                return await _debug_function_async(func, *args, breakpoint_line=breakpoint_line, **kwargs)
-            return async_wrapper
+                return await _debug_function_async(func, source_by_lineno, *args, breakpoint_line=breakpoint_line, **kwargs)
+            return _light_wraps(func, async_wrapper)
         else:
-            @functools.wraps(func)
             def sync_wrapper(*args, **kwargs):
-                return _debug_function_sync(func, *args, breakpoint_line=breakpoint_line, **kwargs)
-            return sync_wrapper
+                return _debug_function_sync(func, source_by_lineno, *args, breakpoint_line=breakpoint_line, **kwargs)
+            return _light_wraps(func, sync_wrapper)
     return decorator
 
-def _debug_function_sync(func, *args, breakpoint_line=None, **kwargs):
+def _debug_function_sync(func, source_by_lineno, *args, breakpoint_line=None, **kwargs):
     """Step-debugging for synchronous functions."""
     step_mode = False 
+    target_code = func.__code__
 
     def trace_calls(frame, event, arg):
         nonlocal step_mode
       
-        if frame.f_code.co_name != func.__name__:
-            return
+        if frame.f_code is not target_code:
+            return None
         if event == "line":
             line_no = frame.f_lineno
-            code = inspect.getframeinfo(frame).code_context[0].strip()
+            code = source_by_lineno[line_no]
             console.print(f"\n🔎 [bold yellow]Executing Line {line_no}:[/bold yellow] {code}")
             _display_variables(frame.f_locals)
             if breakpoint_line and line_no == breakpoint_line:
@@ -134,17 +344,18 @@ def _debug_function_sync(func, *args, breakpoint_line=None, **kwargs):
         sys.settrace(None)
     return result
 
-async def _debug_function_async(func, *args, breakpoint_line=None, **kwargs):
+async def _debug_function_async(func, source_by_lineno, *args, breakpoint_line=None, **kwargs):
     """Step-debugging for asynchronous functions."""
     step_mode = False 
+    target_code = func.__code__
 
     def trace_calls(frame, event, arg):
         nonlocal step_mode
-        if frame.f_code.co_name != func.__name__:
-            return
+        if frame.f_code is not target_code:
+            return None
         if event == "line":
             line_no = frame.f_lineno
-            code = inspect.getframeinfo(frame).code_context[0].strip()
+            code = source_by_lineno[line_no]
             console.print(f"\n🔎 [bold yellow]Executing Line {line_no}:[/bold yellow] {code}")
             _display_variables(frame.f_locals)
             if breakpoint_line and line_no == breakpoint_line:
@@ -1,6 +1,26 @@
-import functools
+import atexit
 import traceback
-from typing import Any
+from typing import Any, TextIO
+
+from .utils import _light_wraps
+
+# Log files stay open for the life of the process, keyed by path and shared by every decorated function.
+_log_files: dict[str, TextIO] = {}
+
+
+def _log_file(path: str) -> TextIO:
+    """Return the cached log file for `path`, opening it on first use."""
+    f = _log_files.get(path)
+    if f is None:
+        f = _log_files.setdefault(path, open(path, "a", buffering=8192))
+    return f
+
+
+@atexit.register
+def _close_log_files() -> None:
+    for f in _log_files.values():
+        f.close()
+
 
 def catch_exception(log_to: str = "errors.log", 
         return_value: Any=None):
@@ -11,7 +31,6 @@ def catch_exception(log_to: str = "errors.log",
         return_value (any, optional): Value to return in case of an exception.
     """
     def decorator(func):
-        @functools.wraps(func)
         def wrapper(*args, **kwargs):
             try:
                 return func(*args, **kwargs)
@@ -19,8 +38,10 @@ def catch_exception(log_to: str = "errors.log",
                 error_log = f"Exception in {func.__name__}(): {str(e)}\n{traceback.format_exc()}\n"
                 
                 if log_to:
-                    with open(log_to, "a") as f:
-                        f.write(error_log)
+                    f = _log_file(log_to)
+                    f.write(error_log)
+                    # Flushed per record so the log survives crashes and can be followed while running.
+                    f.flush()
                 return return_value
-        return wrapper
+        return _light_wraps(func, wrapper)
     return decorator
\ No newline at end of file
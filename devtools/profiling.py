@@ -1,59 +1,92 @@
-import functools
+import sys
+import contextlib
 import time
+import threading
 import psutil
 import tracemalloc
 import inspect
 import asyncio
-from collections import defaultdict
-from .utils import console
+from array import array
+from .utils import console, _light_wraps
 from rich.table import Table
-from rich.live import Live
+from rich.markup import escape
 
+# Seconds between two samples of the profiled function's current line.
+SAMPLE_INTERVAL = 0.001
+# Bytes a function must allocate at peak before `memory_usage` compares snapshots line by line.
+MEMORY_REPORT_THRESHOLD = 1024
+# Seconds between two CPU & memory samples taken by `performance`.
+PERFORMANCE_SAMPLE_INTERVAL = 0.05
 
 def profiling(func):
     """Decorator to profile execution time, memory usage, and function calls."""
-    @functools.wraps(func)
     async def async_wrapper(*args, **kwargs):
-        return await _profile_func(func, *args, **kwargs, is_async=True)
+        return await _profile_async(func, *args, **kwargs)
 
-    @functools.wraps(func)
     def sync_wrapper(*args, **kwargs):
-        return asyncio.run(_profile_func(func, *args, **kwargs, is_async=False))
+        return _profile_sync(func, *args, **kwargs)
 
-    return async_wrapper if asyncio.iscoroutinefunction(func) else sync_wrapper
-async def _profile_func(func, *args, is_async=False, **kwargs):
-    """Handles profiling for both sync & async functions."""
-    
-    tracemalloc.start()
-    start_time = time.time()
-
-    line_times = defaultdict(float)
+    return _light_wraps(func, async_wrapper if asyncio.iscoroutinefunction(func) else sync_wrapper)
 
-    def trace_calls(frame, event, arg):
-        if event == "line":
-            line_no = frame.f_lineno
-            line_times[line_no] += time.time() - start_time
+def _profile_sync(func, *args, **kwargs):
+    """Handles profiling for sync functions."""
+    with _profile_session(func):
+        return func(*args, **kwargs)
 
-    inspect.currentframe().f_trace = trace_calls
+async def _profile_async(func, *args, **kwargs):
+    """Handles profiling for async functions."""
+    with _profile_session(func):
+        return await func(*args, **kwargs)
 
+@contextlib.contextmanager
+def _profile_session(func):
+    """Samples and measures everything run inside the block, then displays the report for `func`."""
+    
+    # Per-line counters are indexed by `lineno - co_firstlineno` rather than hashed by line number.
+    code = func.__code__
+    last_line = max((line for _, _, line in code.co_lines() if line is not None), default=code.co_firstlineno)
+    line_samples = array("q", [0]) * (last_line - code.co_firstlineno + 1)
+    line_times = array("q", [0]) * len(line_samples)
+    stop_event = threading.Event()
+    sampler = threading.Thread(target=_sample_lines,
+                               args=(threading.get_ident(), code, line_samples, line_times, stop_event),
+                               daemon=True)
+    # The sampler is set up and running before tracing starts, so its own memory is not reported.
+    sampler.start()
+
+    start_time = time.perf_counter_ns()
+    tracemalloc.start()
     try:
-        if is_async:
-            result = await func(*args, **kwargs)  
-        else:
-            result = func(*args, **kwargs)
+        yield
     finally:
-        end_time = time.time()
+        # Collect memory usage before stopping, tracemalloc resets its counters on stop.
+        memory_stats = tracemalloc.get_traced_memory()
+        end_time = time.perf_counter_ns()
         tracemalloc.stop()
+        stop_event.set()
+        sampler.join()
 
-    # Collect memory usage
-    memory_stats = tracemalloc.get_traced_memory()
-    execution_time = (end_time - start_time) * 1000  
+    execution_time = (end_time - start_time) / 1_000_000
     peak_memory = memory_stats[1] / 1024  
 
-    _display_profile(func.__name__, execution_time, peak_memory, line_times)
-    return result
-
-def _display_profile(func_name, execution_time, peak_memory, line_times):
+    _display_profile(func.__name__, execution_time, peak_memory, code.co_firstlineno, line_samples, line_times)
+
+def _sample_lines(thread_id, code, line_samples, line_times, stop_event):
+    """Attribute the time since the previous sample to the line of `code` the given thread is executing."""
+    first_line = code.co_firstlineno
+    prev_time = time.perf_counter_ns()
+    while not stop_event.wait(SAMPLE_INTERVAL):
+        now = time.perf_counter_ns()
+        frame = sys._current_frames().get(thread_id)
+        while frame is not None and frame.f_code is not code:
+            frame = frame.f_back
+        if frame is not None and frame.f_lineno is not None:
+            index = frame.f_lineno - first_line
+            line_samples[index] += 1
+            line_times[index] += now - prev_time
+        prev_time = now
+
+def _display_profile(func_name, execution_time, peak_memory, first_line, line_samples, line_times):
     """Formats and displays profiling results in a table."""
     
     table = Table(title=f"⚡ Profiling Report: {func_name}")
@@ -65,13 +98,15 @@ def _display_profile(func_name, execution_time, peak_memory, line_times):
 
     console.print(table)
 
-    if line_times:
+    if any(line_samples):
         line_table = Table(title=f"📊 Line Execution Times: {func_name}")
         line_table.add_column("Line No.", style="magenta", justify="right")
+        line_table.add_column("Samples", style="yellow", justify="right")
         line_table.add_column("Execution Time (ms)", style="cyan", justify="right")
 
-        for line, exec_time in sorted(line_times.items()):
-            line_table.add_row(str(line), f"{exec_time:.2f}")
+        for index, samples in enumerate(line_samples):
+            if samples:
+                line_table.add_row(str(first_line + index), str(samples), f"{line_times[index] / 1_000_000:.2f}")
 
         console.print(line_table)
         
@@ -81,20 +116,27 @@ def _display_profile(func_name, execution_time, peak_memory, line_times):
 
 def memory_usage(func):
     """Decorator to measure memory usage of a function and track each variable with line numbers."""
-    @functools.wraps(func)
     def wrapper(*args, **kwargs):
+        # Only allocations made in the function's own file are compared, not the whole process.
+        trace_filters = [tracemalloc.Filter(inclusive=True, filename_pattern=func.__code__.co_filename)]
         tracemalloc.start()
 
-        snapshot_before = tracemalloc.take_snapshot()
+        snapshot_before = tracemalloc.take_snapshot().filter_traces(trace_filters)
+        # The snapshot itself is traced, so only growth past this baseline counts towards the threshold.
+        tracemalloc.reset_peak()
+        baseline, _ = tracemalloc.get_traced_memory()
 
         result = func(*args, **kwargs) 
 
-        snapshot_after = tracemalloc.take_snapshot()
         current, peak = tracemalloc.get_traced_memory()
+        if peak - baseline >= MEMORY_REPORT_THRESHOLD:
+            snapshot_after = tracemalloc.take_snapshot().filter_traces(trace_filters)
+        else:
+            snapshot_after = None
         tracemalloc.stop()
 
         memory_diff = {}
-        stats = snapshot_after.compare_to(snapshot_before, "lineno")
+        stats = snapshot_after.compare_to(snapshot_before, "lineno") if snapshot_after else []
 
         for stat in stats:
             line_number = stat.traceback[0].lineno
@@ -109,9 +151,12 @@ def memory_usage(func):
         table.add_column("Code", style="yellow", justify="left")
         table.add_column("Memory (KB)", style="red", justify="right")
 
-        for i, code_line in enumerate(source_lines, start=start_line):
-            if i in memory_diff:
-                table.add_row(str(i), code_line.strip(), f"{memory_diff[i]:.2f} KB")
+        # Only the few allocating lines are looked up; lines of the same file outside `func` are skipped.
+        src_map = dict(zip(range(start_line, start_line + len(source_lines)), source_lines))
+        for lineno, memory_used_kb in sorted(memory_diff.items()):
+            code_line = src_map.get(lineno)
+            if code_line is not None:
+                table.add_row(str(lineno), escape(code_line.strip()), f"{memory_used_kb:.2f} KB")
 
         console.print(table)
         console.print(f"[bold yellow]🔍 Total Memory Used:[/bold yellow] {current / 1024:.2f} KB")
@@ -119,32 +164,47 @@ def memory_usage(func):
 
         return result
 
-    return wrapper
+    return _light_wraps(func, wrapper)
 
 
 
 def performance(func):
     """Decorator to monitor CPU & memory usage during function execution."""
-    @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        with Live(auto_refresh=False) as live:
-            table = Table(title=f"Performance Monitoring: {func.__name__}()")
-            table.add_column("Time (s)", justify="right", style="magenta")
-            table.add_column("CPU (%)", justify="right", style="yellow")
-            table.add_column("Memory (MB)", justify="right", style="red")
-
-            start_time = time.time()
-            result = None
-
-            def update_table():
-                elapsed = time.time() - start_time
-                cpu_usage = psutil.cpu_percent()
-                mem_usage = psutil.virtual_memory().used / (1024 * 1024)  # Convert to MB
-                table.add_row(f"{elapsed:.2f}", f"{cpu_usage}%", f"{mem_usage:.2f} MB")
-                live.update(table, refresh=True)
-
+        process = psutil.Process()
+        # The first call only primes the counter, later non-blocking calls report usage since the previous one.
+        process.cpu_percent(interval=None)
+        samples = []
+        stop_event = threading.Event()
+        start_time = time.perf_counter_ns()
+
+        def sample():
+            elapsed = (time.perf_counter_ns() - start_time) / 1_000_000_000
+            mem_usage = process.memory_info().rss / (1024 * 1024)  # Convert to MB
+            samples.append((elapsed, process.cpu_percent(interval=None), mem_usage))
+
+        def sampler():
+            while not stop_event.wait(PERFORMANCE_SAMPLE_INTERVAL):
+                sample()
+
+        sampler_thread = threading.Thread(target=sampler, daemon=True)
+        sampler_thread.start()
+        try:
             result = func(*args, **kwargs)
-            update_table()
+        finally:
+            stop_event.set()
+            sampler_thread.join()
+        if not samples:
+            # Functions faster than one interval still get a row.
+            sample()
+
+        table = Table(title=f"Performance Monitoring: {func.__name__}()")
+        table.add_column("Time (s)", justify="right", style="magenta")
+        table.add_column("CPU (%)", justify="right", style="yellow")
+        table.add_column("Memory (MB)", justify="right", style="red")
+        for elapsed, cpu_usage, mem_usage in samples:
+            table.add_row(f"{elapsed:.2f}", f"{cpu_usage}%", f"{mem_usage:.2f} MB")
+        console.print(table)
 
-            return result
-    return wrapper
\ No newline at end of file
+        return result
+    return _light_wraps(func, wrapper)
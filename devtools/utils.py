@@ -1,27 +1,98 @@
+import os
+import atexit
 import functools
 import time
 import asyncio
 import requests
+from requests.adapters import HTTPAdapter
 import json
 from rich.table import Table
 from rich.panel import Panel
-from rich.json import JSON
+from rich.syntax import Syntax
 from rich.console import Console
 import concurrent.futures
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 console = Console()
 
 
-executor = concurrent.futures.ThreadPoolExecutor() 
+def _light_wraps(func, wrapper):
+    """Make `wrapper` look like `func`, copying only the attributes devtools and pickling rely on.
+
+    Cheaper than `functools.wraps`, which also merges `__dict__` and copies annotations.
+    """
+    for attr in ("__module__", "__name__", "__qualname__", "__doc__"):
+        # Like `functools.update_wrapper`, skip what `func` lacks, e.g. a `functools.partial` has no `__name__`.
+        try:
+            value = getattr(func, attr)
+        except AttributeError:
+            continue
+        setattr(wrapper, attr, value)
+    wrapper.__wrapped__ = func
+    return wrapper
+
+
+def _dump_json(obj, allow_orjson: bool = True) -> str:
+    """Pretty-print `obj` as JSON, using orjson when it is installed and can encode `obj` faithfully."""
+    if orjson is not None and allow_orjson:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_INDENT_2).decode()
+        except orjson.JSONEncodeError:
+            # e.g. integers wider than 64 bits, which the standard library handles.
+            pass
+    return json.dumps(obj, indent=2)
+
+
+# Largest response body, in bytes, that RequestLogger reads eagerly and displays.
+MAX_BODY_SIZE = 1024 * 1024
+
+_io_pool = concurrent.futures.ThreadPoolExecutor(max_workers=int(os.getenv("DEVTOOLS_IO_WORKERS", "16")),
+                                                 thread_name_prefix="devtools-io")
+atexit.register(_io_pool.shutdown)
+# Created on first use so importing devtools never sets up multiprocessing.
+_cpu_pool = None
+
+# Mounted on every RequestLogger session so connection pools, keep-alive and TLS sessions outlive a
+# single context, while cookies, headers and auth stay per session.
+_HTTP_POOL_SIZE = 64
+_http_adapter = HTTPAdapter(pool_connections=32, pool_maxsize=_HTTP_POOL_SIZE)
+
+def _get_cpu_pool():
+    """Return the process pool used by `run_async(kind="cpu")`, creating it on first use."""
+    global _cpu_pool
+    if _cpu_pool is None:
+        _cpu_pool = concurrent.futures.ProcessPoolExecutor(max_workers=os.cpu_count())
+        atexit.register(_cpu_pool.shutdown)
+    return _cpu_pool
+
+def _call_wrapped(wrapper, *args, **kwargs):
+    """Run the function behind a `run_async` wrapper in a worker process."""
+    # Only the wrapper pickles by reference: its module-level name resolves to the wrapper, not to `func`.
+    return wrapper.__wrapped__(*args, **kwargs)
 
-def run_async(func):
-    """Decorator to run a function in a separate thread (non-blocking)."""
+def run_async(func=None, *, kind="io"):
+    """Decorator to run a function in a separate thread or process (non-blocking).
+
+    Args:
+        kind (str): "io" runs the function on the shared thread pool, "cpu" on a process pool
+            so CPU-bound work is not serialized by the GIL.
+    """
+    if func is None:
+        return functools.partial(run_async, kind=kind)
+    if kind not in ("io", "cpu"):
+        raise ValueError(f"kind must be 'io' or 'cpu', got {kind!r}")
     
-    @functools.wraps(func)
     def wrapper(*args, **kwargs):
         console.print(f"[bold cyan]🚀 Starting {func.__name__}...[/bold cyan]")
 
-        future = executor.submit(func, *args, **kwargs)  
+        if kind == "cpu":
+            future = _get_cpu_pool().submit(_call_wrapped, wrapper, *args, **kwargs)
+        else:
+            future = _io_pool.submit(func, *args, **kwargs)  
 
         def done_callback(f):
             try:
@@ -31,7 +102,7 @@ def run_async(func):
 
         future.add_done_callback(done_callback)
         return future 
-    return wrapper
+    return _light_wraps(func, wrapper)
 
 
 
@@ -44,8 +115,10 @@ def retry(max_attempts=3, backoff=1.5, exceptions=(Exception,)):
         exceptions (tuple): Tuple of exception types to retry on.
     """
 
+    # max_attempts and backoff are fixed once the decorator is applied, so the delays are too.
+    waits = tuple(backoff ** i for i in range(1, max_attempts + 1))
+
     def decorator(func):
-        @functools.wraps(func)
         async def async_wrapper(*args, **kwargs):
             """Handles retrying for async functions."""
             attempts = 0
@@ -54,7 +127,7 @@ def retry(max_attempts=3, backoff=1.5, exceptions=(Exception,)):
                     return await func(*args, **kwargs)
                 except exceptions as e:
                     attempts += 1
-                    wait_time = backoff ** attempts
+                    wait_time = waits[attempts - 1]
                     console.print(f"[bold yellow]⚠️ Attempt {attempts}/{max_attempts} failed: {e}. Retrying in {wait_time:.2f}s...[/bold yellow]")
                     await asyncio.sleep(wait_time)
                 except Exception as e:
@@ -63,7 +136,6 @@ def retry(max_attempts=3, backoff=1.5, exceptions=(Exception,)):
             console.print(f"[bold red]❌ {func.__name__} failed after {max_attempts} attempts.[/bold red]")
             return None
         
-        @functools.wraps(func)
         def sync_wrapper(*args, **kwargs):
             """Handles retrying for sync functions."""
             attempts = 0
@@ -72,7 +144,7 @@ def retry(max_attempts=3, backoff=1.5, exceptions=(Exception,)):
                     return func(*args, **kwargs)
                 except exceptions as e:
                     attempts += 1
-                    wait_time = backoff ** attempts
+                    wait_time = waits[attempts - 1]
                     console.print(f"[bold yellow]⚠️ Attempt {attempts}/{max_attempts} failed: {e}. Retrying in {wait_time:.2f}s...[/bold yellow]")
                     time.sleep(wait_time)
                 except Exception as e:
@@ -81,7 +153,7 @@ def retry(max_attempts=3, backoff=1.5, exceptions=(Exception,)):
             console.print(f"[bold red]❌ {func.__name__} failed after {max_attempts} attempts.[/bold red]")
             return None
         
-        return async_wrapper if asyncio.iscoroutinefunction(func) else sync_wrapper
+        return _light_wraps(func, async_wrapper if asyncio.iscoroutinefunction(func) else sync_wrapper)
     
     return decorator
 
@@ -89,6 +161,14 @@ def retry(max_attempts=3, backoff=1.5, exceptions=(Exception,)):
 
 
 
+def _response_size(response) -> int:
+    """Size of the response body, from `Content-Length` when the server sent it so the body is not read."""
+    content_length = response.headers.get("Content-Length")
+    if content_length is not None and content_length.isdigit():
+        return int(content_length)
+    return len(response.content) if response.content else 0
+
+
 class RequestLogger:
     """Context manager to log API requests and their performance with session support."""
     
@@ -105,11 +185,13 @@ class RequestLogger:
         self.end_time = None
         self.responses = []
         self.request_info = None
-        self.session = requests.Session() 
+        self.session = requests.Session()
+        self.session.mount("https://", _http_adapter)
+        self.session.mount("http://", _http_adapter)
 
     def __enter__(self):
         """Start timing the request session when entering the context."""
-        self.start_time = time.time()
+        self.start_time = time.perf_counter_ns()
         return self
 
     def request(self, method, url, **kwargs):
@@ -122,23 +204,38 @@ class RequestLogger:
             "Proxies": kwargs.get("proxies", {})
         }
 
-        for i in range(1, self.iterations + 1):
+        def send(i):
             try:
-                response = self.session.request(method, url, **kwargs)
-                self.responses.append(response)
+                response = self.session.request(method, url, **{"stream": True, **kwargs})
+                if _response_size(response) <= MAX_BODY_SIZE:
+                    # Small bodies are read now so the connection goes back to the pool, larger ones stay streamed.
+                    response.content
                 console.print(f"[bold cyan]✔ Request {i}/{self.iterations} completed[/bold cyan]")
+                return response
             except Exception as e:
                 console.print(f"[bold red]❌ Request {i} failed: {e}[/bold red]")
-                self.responses.append(None)
+                return None
+
+        if self.iterations < 1:
+            return self.responses[-1] if self.responses else None
+
+        # Iterations are issued concurrently, so the batch takes about as long as the slowest request.
+        # They get their own pool: waiting on `_io_pool` could deadlock when called from a `run_async` job.
+        # More workers than pooled connections would only open connections that get thrown away.
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(self.iterations, _HTTP_POOL_SIZE)) as pool:
+            self.responses.extend(pool.map(send, range(1, self.iterations + 1)))
         
         return self.responses[-1] if self.responses else None 
 
     def __exit__(self, exc_type, exc_value, traceback):
         """Log request details when exiting the context."""
-        self.end_time = time.time()
+        self.end_time = time.perf_counter_ns()
+        # Detach the shared adapter first, closing the session would otherwise close its pools too.
+        self.session.adapters.clear()
+        self.session.close()
         if not self.responses:
             return 
-        duration = (self.end_time - self.start_time) * 1000  
+        duration = (self.end_time - self.start_time) / 1_000_000
 
         # Table 1: Request Info
         request_table = Table(title="🌐 API Request Info", show_header=True)
@@ -160,17 +257,26 @@ class RequestLogger:
 
         for i, response in enumerate(self.responses, start=1):
             if response:
-                response_size = len(response.content) if response.content else 0
+                response_size = _response_size(response)
                 stats_table.add_row(str(i), str(response.status_code), f"{response_size} bytes", f"{duration:.2f} ms")
             else:
                 stats_table.add_row(str(i), "Failed", "-", "-")
 
         console.print(stats_table)
 
-        if self.responses[-1]:
+        for response in self.responses[:-1]:
+            if response is not None:
+                response.close()
+
+        if self.responses[-1] is not None and _response_size(self.responses[-1]) > MAX_BODY_SIZE:
+            console.print(f"[dim]📜 Response body not displayed, larger than {MAX_BODY_SIZE} bytes.[/dim]")
+        elif self.responses[-1]:
             try:
                 json_response = self.responses[-1].json()
-                console.print(Panel.fit(JSON(json.dumps(json_response, indent=2)), title="📜 JSON Response", border_style="green"))
+                # orjson writes NaN and Infinity as null, keep them as the server sent them.
+                body = self.responses[-1].content
+                allow_orjson = b"NaN" not in body and b"Infinity" not in body
+                console.print(Panel.fit(Syntax(_dump_json(json_response, allow_orjson), "json", theme="ansi_dark"), title="📜 JSON Response", border_style="green"))
             except json.JSONDecodeError:
                 console.print(Panel.fit(self.responses[-1].text, title="📜 Plain Text Response", border_style="yellow"))
 
@@ -179,5 +285,3 @@ class RequestLogger:
                 for i, response in enumerate(self.responses, start=1):
                     if response:
                         f.write(f"{self.request_info['Method']} {self.request_info['URL']} - Iteration {i} - {response.status_code}\n")
-
-        self.session.close() 